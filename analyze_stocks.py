@@ -4,11 +4,125 @@
 用于读取通达信导出的股票列表并进行分析
 """
 
+import codecs
+import contextlib
+import hashlib
+import io
 import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+# 可选 Polars 后端（设置 STOCK_ENGINE=polars 启用，多线程 Arrow 解析）
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+_USE_POLARS = os.environ.get('STOCK_ENGINE', '').lower() == 'polars' and pl is not None
+
+# 首行"股票名称(代码)"匹配（预编译，read_tdx_export 每个文件都会用到）
+_HEADER_RE = re.compile(r'([一-龥]+)\s*[\(（]([0-9]+)[\)）]')
+
+# 代码列清理：一次遍历去掉 = 和 "（通达信导出格式为 ="600000"）
+_CODE_TRANS = str.maketrans('', '', '="')
+
+# 可选 Numba：把 min/max/mean/涨跌计数融合成对数组的单次遍历
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True)
+    def _change_stats(a):
+        """单次遍历统计（忽略 NaN），返回 (最小, 最大, 均值, 上涨数, 下跌数, 平盘数)"""
+        s = 0.0
+        cnt = 0
+        mn = np.inf
+        mx = -np.inf
+        up = dn = fl = 0
+        for i in range(a.size):
+            x = a[i]
+            if x != x:  # NaN
+                continue
+            s += x
+            cnt += 1
+            if x > mx:
+                mx = x
+            if x < mn:
+                mn = x
+            if x > 0:
+                up += 1
+            elif x < 0:
+                dn += 1
+            else:
+                fl += 1
+        if cnt == 0:
+            return np.nan, np.nan, np.nan, 0, 0, 0
+        return mn, mx, s / cnt, up, dn, fl
+else:
+    def _change_stats(a):
+        """numpy 回退版：与 JIT 版返回相同的 6 元组"""
+        valid = a[~np.isnan(a)]
+        if valid.size == 0:
+            return np.nan, np.nan, np.nan, 0, 0, 0
+        return (valid.min(), valid.max(), valid.mean(),
+                int((valid > 0).sum()), int((valid < 0).sum()), int((valid == 0).sum()))
+
+
+# 解析结果缓存目录（键含 mtime/size，文件变了自动失效）
+_CACHE_DIR = Path(__file__).parent / '.stockcache'
+
+
+def _cached_load(file_path, parser):
+    """
+    按 (路径, mtime, size) 缓存解析结果，重复分析同一文件时跳过解析和解码
+    """
+    try:
+        st = file_path.stat()
+        key = hashlib.blake2b(
+            f"{file_path}:{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()
+        cache_file = _CACHE_DIR / f"{key}.pkl"
+        if cache_file.exists():
+            return pd.read_pickle(cache_file)
+    except Exception:
+        cache_file = None
+
+    result = parser(file_path)
+
+    # 解析失败不写缓存
+    ok = result[0] is not None if isinstance(result, tuple) else result is not None
+    if cache_file is not None and ok:
+        try:
+            _CACHE_DIR.mkdir(exist_ok=True)
+            pd.to_pickle(result, cache_file)
+        except Exception:
+            pass
+    return result
+
+
+def _sniff_encoding(file_path, sample_size=32768):
+    """
+    从文件头部采样探测编码（BOM 优先），避免整个文件逐编码试错解析
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(sample_size)
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    # 采样可能把多字节字符截成两半，增量解码器按"数据未结束"处理尾部
+    at_eof = len(head) < sample_size
+    for enc in ('utf-8', 'gbk'):
+        try:
+            codecs.getincrementaldecoder(enc)().decode(head, at_eof)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return 'gb2312'
+
 
 def read_tdx_export(file_path):
     """
@@ -26,45 +140,46 @@ def read_tdx_export(file_path):
     
     try:
         if suffix == '.csv':
-            for encoding in ['gbk', 'utf-8', 'gb2312']:
-                try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    print(f"成功读取 CSV 文件，编码: {encoding}")
-                    return df, stock_info
-                except UnicodeDecodeError:
-                    continue
-        
+            encoding = _sniff_encoding(file_path)
+            try:
+                # PyArrow 引擎多线程解析，大文件上快于默认 C 引擎
+                df = pd.read_csv(file_path, encoding=encoding, engine='pyarrow')
+            except (ImportError, ValueError):
+                df = pd.read_csv(file_path, encoding=encoding)
+            print(f"成功读取 CSV 文件，编码: {encoding}")
+            return df, stock_info
+
         elif suffix == '.txt':
-            for encoding in ['gbk', 'utf-8', 'gb2312']:
-                try:
-                    df = pd.read_csv(file_path, sep='\t', encoding=encoding)
-                    print(f"成功读取 TXT 文件，编码: {encoding}")
-                    return df, stock_info
-                except UnicodeDecodeError:
-                    continue
+            encoding = _sniff_encoding(file_path)
+            try:
+                df = pd.read_csv(file_path, sep='\t', encoding=encoding, engine='pyarrow')
+            except (ImportError, ValueError):
+                df = pd.read_csv(file_path, sep='\t', encoding=encoding)
+            print(f"成功读取 TXT 文件，编码: {encoding}")
+            return df, stock_info
         
         elif suffix in ['.xls', '.xlsx']:
-            import re
             # 通达信导出的 xls 实际上是制表符分隔的文本文件
             try:
-                with open(file_path, 'r', encoding='gbk') as f:
-                    lines = f.readlines()
-                
+                # 只读一次字节，表头嗅探和正式解析共用同一份数据
+                raw = file_path.read_bytes()
+                head_lines = raw[:8192].decode('gbk', errors='replace').split('\n', 20)
+
                 # 第一行是股票名称
-                first_line = lines[0].strip()
-                match = re.search(r'([\u4e00-\u9fa5]+)\s*[\(（]([0-9]+)[\)）]', first_line)
+                first_line = head_lines[0].strip()
+                match = _HEADER_RE.search(first_line)
                 if match:
                     stock_info = {'name': match.group(1), 'code': match.group(2)}
                 
-                # 找到表头行（包含"时间"的行）
+                # 找到表头行（包含"时间"的行，只在文件头部找）
                 header_idx = 0
-                for i, line in enumerate(lines):
+                for i, line in enumerate(head_lines):
                     if '时间' in line:
                         header_idx = i
                         break
-                
-                # 使用制表符分隔读取
-                df = pd.read_csv(file_path, sep='\t', encoding='gbk', 
+
+                # 使用制表符分隔读取（复用已读入的字节，避免二次读盘+解码）
+                df = pd.read_csv(io.BytesIO(raw), sep='\t', encoding='gbk',
                                 skiprows=header_idx, skipinitialspace=True)
                 
                 # 清理列名中的空白
@@ -145,11 +260,13 @@ def analyze_kline(df, stock_info=None):
     # 价格分析
     if 'close' in df.columns:
         close = pd.to_numeric(df['close'], errors='coerce')
+        close_min, close_max, close_mean, _, _, _ = \
+            _change_stats(close.to_numpy(dtype=np.float64))
         print(f"\n💰 价格统计:")
         print(f"   最新收盘: {close.iloc[-1]:.2f}")
-        print(f"   最高价格: {close.max():.2f}")
-        print(f"   最低价格: {close.min():.2f}")
-        print(f"   平均价格: {close.mean():.2f}")
+        print(f"   最高价格: {close_max:.2f}")
+        print(f"   最低价格: {close_min:.2f}")
+        print(f"   平均价格: {close_mean:.2f}")
         
         # 计算涨跌幅
         if len(close) > 1:
@@ -159,9 +276,10 @@ def analyze_kline(df, stock_info=None):
     # 成交量分析
     if 'volume' in df.columns:
         vol = pd.to_numeric(df['volume'], errors='coerce')
+        _, vol_max, vol_mean, _, _, _ = _change_stats(vol.to_numpy(dtype=np.float64))
         print(f"\n📊 成交量统计:")
-        print(f"   平均成交: {vol.mean()/10000:.2f} 万")
-        print(f"   最大成交: {vol.max()/10000:.2f} 万")
+        print(f"   平均成交: {vol_mean/10000:.2f} 万")
+        print(f"   最大成交: {vol_max/10000:.2f} 万")
     
     # MACD分析
     macd_cols = [c for c in df.columns if 'MACD' in str(c).upper()]
@@ -191,30 +309,60 @@ def export_filtered(df, output_path, condition=None):
     return filtered_df
 
 
+def _read_stock_list_polars(file_path):
+    """
+    Polars 快速路径：多线程解析 + 向量化清洗，边界处转回 pandas
+    """
+    encoding = _sniff_encoding(file_path)
+    raw = file_path.read_bytes().decode(encoding, errors='replace').encode('utf-8')
+
+    pldf = pl.read_csv(io.BytesIO(raw), separator='\t')
+    pldf = pldf.rename({c: c.strip() for c in pldf.columns})
+
+    if '代码' in pldf.columns:
+        pldf = pldf.with_columns(
+            pl.col('代码').cast(pl.Utf8).str.replace_all('="', '').str.replace_all('"', '')
+        )
+
+    # 过滤掉注释行
+    first_col = pldf.columns[0]
+    pldf = pldf.filter(
+        ~pl.col(first_col).cast(pl.Utf8).fill_null('').str.starts_with('#')
+    )
+
+    return pldf.to_pandas()
+
+
 def read_stock_list(file_path):
     """
     读取通达信导出的自选股列表
     """
     file_path = Path(file_path)
-    
+
     try:
-        with open(file_path, 'r', encoding='gbk') as f:
-            lines = f.readlines()
-        
-        # 使用制表符分隔读取
-        df = pd.read_csv(file_path, sep='\t', encoding='gbk', skipinitialspace=True)
-        
-        # 清理列名
-        df.columns = [str(c).strip() for c in df.columns]
-        
-        # 清理代码列（去掉="）
-        if '代码' in df.columns:
-            df['代码'] = df['代码'].astype(str).str.replace('="', '').str.replace('"', '')
-        
-        # 过滤掉注释行
-        df = df[~df.iloc[:, 0].astype(str).str.startswith('#')]
-        
-        print(f"成功读取自选股列表")
+        if _USE_POLARS:
+            df = _read_stock_list_polars(file_path)
+            print(f"成功读取自选股列表 (polars)")
+        else:
+            # 使用制表符分隔读取（编码按文件头采样探测；注释行由 C 解析器直接跳过）
+            encoding = _sniff_encoding(file_path)
+            df = pd.read_csv(file_path, sep='\t', encoding=encoding,
+                             skipinitialspace=True, comment='#')
+
+            # 清理列名
+            df.columns = [str(c).strip() for c in df.columns]
+
+            # 清理代码列（去掉="，单次遍历）
+            if '代码' in df.columns:
+                df['代码'] = df['代码'].astype(str).str.translate(_CODE_TRANS)
+
+            print(f"成功读取自选股列表")
+
+        # 低基数字符串列转 categorical（内存降一个量级，groupby/比较走整数码）
+        for col in ('代码', '名称'):
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+
         return df
     except Exception as e:
         print(f"读取失败: {e}")
@@ -229,54 +377,39 @@ def analyze_stock_list(df):
         print("没有数据")
         return
     
-    # 识别分组标记行和股票行
-    groups = {}
-    current_group = "未分类"
-    
-    for idx, row in df.iterrows():
-        code = str(row.get('代码', '')).strip()
-        name = str(row.get('名称', '')).strip()
-        
-        # 判断是否为分组标记行（代码列是中文或特殊标记）
-        if not code or not code[0].isdigit():
-            # 这是分组标记行
-            group_name = code if code else name
-            if group_name and '重复' not in group_name and '数据来源' not in group_name:
-                current_group = group_name
-                if current_group not in groups:
-                    groups[current_group] = []
-        else:
-            # 这是股票行
-            if current_group not in groups:
-                groups[current_group] = []
-            groups[current_group].append(row)
-    
-    # 转换为DataFrame
-    group_dfs = {}
-    for g, rows in groups.items():
-        if rows:
-            group_dfs[g] = pd.DataFrame(rows)
-    
-    # 分离大盘指数
-    all_stocks = pd.concat(group_dfs.values()) if group_dfs else df
-    index_df = all_stocks[all_stocks['代码'].astype(str).str.startswith('99')]
-    
-    # 统计重复股票
-    all_codes = []
-    for g, gdf in group_dfs.items():
-        codes = gdf[~gdf['代码'].astype(str).str.startswith('99')]['代码'].tolist()
-        all_codes.extend([(c, g) for c in codes])
-    
-    from collections import Counter
-    code_counts = Counter([c for c, g in all_codes])
-    duplicates = {c: [] for c, cnt in code_counts.items() if cnt > 1}
-    for c, g in all_codes:
-        if c in duplicates:
-            duplicates[c].append(g)
-    
+    # 涨幅% 一次性转为数值列，后续排序/统计/打印复用（避免重复解析字符串）
+    if '涨幅%' in df.columns:
+        df['_chg'] = pd.to_numeric(df['涨幅%'], errors='coerce')
+
+    # 识别分组标记行和股票行（向量化，避免逐行 iterrows）
+    codes = df['代码'].astype(str).str.strip()
+    names = df['名称'].astype(str).str.strip() if '名称' in df.columns else codes
+
+    # 分组标记行：代码列是中文或特殊标记（首字符不是数字）
+    is_header = ~codes.str.match(r'\d')
+
+    # 大盘指数行（99 开头）只判一次，后面三处过滤复用
+    is_index = codes.str.startswith('99')
+
+    # 标记行的分组名（排除"重复"/"数据来源"等提示行，它们不开启新分组）
+    labels = codes.where(codes.ne(''), names)
+    is_group_mark = is_header & labels.ne('') & ~labels.str.contains('重复|数据来源')
+    group_names = labels.where(is_group_mark).ffill().fillna('未分类')
+
+    # 股票行按分组切分（同名分组自动合并，保持出现顺序；不物化中间字典）
+    stock_rows = df[~is_header]
+    grouped = stock_rows.groupby(group_names[~is_header], sort=False)
+
+    # 分离大盘指数（99 开头的行不可能是分组标记行）
+    index_df = df[is_index]
+
+    # 统计重复股票（单次 groupby 聚合，替代 Counter + 元组列表）
+    mask_stock = ~is_header & ~is_index
+    dup_series = group_names[mask_stock].groupby(codes[mask_stock], sort=False).agg(list)
+    duplicates = dup_series[dup_series.map(len) > 1].to_dict()
+
     # 合并所有个股并去重
-    stock_df = all_stocks[~all_stocks['代码'].astype(str).str.startswith('99')]
-    stock_df = stock_df.drop_duplicates(subset=['代码'])
+    stock_df = df[mask_stock].drop_duplicates(subset=['代码'])
     
     print("\n" + "=" * 60)
     print("📊 自选股池分析")
@@ -287,13 +420,13 @@ def analyze_stock_list(df):
         print("\n" + "─" * 40)
         print("📈 【大盘指数】")
         print("─" * 40)
-        for _, row in index_df.iterrows():
-            name = row.get('名称', '')
-            price = row.get('现价', 0)
-            change = row.get('涨幅%', 0)
-            try:
-                print(f"   {name}: {price}  ({float(change):+.2f}%)")
-            except:
+        idx_names = index_df['名称'].to_numpy() if '名称' in index_df.columns else index_df['代码'].astype(str).to_numpy()
+        idx_prices = index_df['现价'].to_numpy() if '现价' in index_df.columns else np.zeros(len(index_df))
+        idx_chgs = index_df['_chg'].to_numpy() if '_chg' in index_df.columns else np.zeros(len(index_df))
+        for name, price, change in zip(idx_names, idx_prices, idx_chgs):
+            if pd.notna(change):
+                print(f"   {name}: {price}  ({change:+.2f}%)")
+            else:
                 print(f"   {name}: {price}")
     
     # ===== 重复股票（多重信号）=====
@@ -313,29 +446,33 @@ def analyze_stock_list(df):
     print("📋 【按公式分组】")
     print("─" * 40)
     
-    for group_name, gdf in group_dfs.items():
-        # 过滤掉指数
-        gdf_stocks = gdf[~gdf['代码'].astype(str).str.startswith('99')]
+    # 攒成一个缓冲区一次性输出，避免每行 print 的加锁/编码/刷新开销
+    lines = []
+    for group_name, gdf in grouped:
+        # 过滤掉指数（复用预计算的掩码）
+        gdf_stocks = gdf[~is_index.loc[gdf.index]]
         if gdf_stocks.empty:
             continue
-            
-        print(f"\n▶ {group_name} ({len(gdf_stocks)}只)")
-        
-        # 按涨幅排序
-        if '涨幅%' in gdf_stocks.columns:
-            gdf_stocks = gdf_stocks.copy()
-            gdf_stocks['涨幅%'] = pd.to_numeric(gdf_stocks['涨幅%'], errors='coerce')
-            gdf_stocks = gdf_stocks.sort_values('涨幅%', ascending=False)
-        
-        for _, row in gdf_stocks.iterrows():
-            code = str(row.get('代码', ''))
-            name = str(row.get('名称', ''))
-            change = row.get('涨幅%', 0)
+
+        lines.append('')
+        lines.append(f"▶ {group_name} ({len(gdf_stocks)}只)")
+
+        g_codes = gdf_stocks['代码'].astype(str).to_numpy()
+        g_names = gdf_stocks['名称'].astype(str).to_numpy() if '名称' in gdf_stocks.columns else g_codes
+        g_chgs = gdf_stocks['_chg'].to_numpy(dtype=np.float64) if '_chg' in gdf_stocks.columns else np.zeros(len(gdf_stocks))
+
+        # 按涨幅排序：只对三个展示列的排列排序，不对整帧 sort_values
+        if '_chg' in gdf_stocks.columns:
+            order = np.argsort(-g_chgs, kind='stable')
+            g_codes, g_names, g_chgs = g_codes[order], g_names[order], g_chgs[order]
+        for code, name, change in zip(g_codes, g_names, g_chgs):
             dup_mark = " ⭐" if code in duplicates else ""
-            try:
-                print(f"   {name}: {float(change):+.2f}%{dup_mark}")
-            except:
-                print(f"   {name}{dup_mark}")
+            if pd.notna(change):
+                lines.append(f"   {name}: {change:+.2f}%{dup_mark}")
+            else:
+                lines.append(f"   {name}{dup_mark}")
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
     
     # ===== 汇总统计 =====
     print("\n" + "─" * 40)
@@ -347,37 +484,66 @@ def analyze_stock_list(df):
     print("📊 【统计信息】")
     print("─" * 40)
     
-    if '涨幅%' in stock_df.columns:
-        changes = pd.to_numeric(stock_df['涨幅%'], errors='coerce')
-        up_count = (changes > 0).sum()
-        down_count = (changes < 0).sum()
-        flat_count = (changes == 0).sum()
+    if '_chg' in stock_df.columns:
+        # 6 项统计一次遍历算完（见 _change_stats）
+        chg_min, chg_max, chg_mean, up_count, down_count, flat_count = \
+            _change_stats(stock_df['_chg'].to_numpy(dtype=np.float64))
         print(f"   上涨: {up_count} 只  |  下跌: {down_count} 只  |  平盘: {flat_count} 只")
-        print(f"   最大涨幅: {changes.max():+.2f}%  |  最大跌幅: {changes.min():+.2f}%")
-        print(f"   平均涨幅: {changes.mean():+.2f}%")
+        print(f"   最大涨幅: {chg_max:+.2f}%  |  最大跌幅: {chg_min:+.2f}%")
+        print(f"   平均涨幅: {chg_mean:+.2f}%")
     
-    # 涨幅榜
+    # 涨幅榜（argpartition 选前/后5只，O(N)；原先未排序就取 head/tail 是错的）
+    rank_names = stock_df['名称'].to_numpy() if '名称' in stock_df.columns else stock_df['代码'].to_numpy()
+    rank_chgs = stock_df['_chg'].to_numpy(dtype=np.float64) if '_chg' in stock_df.columns else np.zeros(len(stock_df))
+    k = min(5, len(rank_chgs))
+
+    # NaN 替换成哨兵值，保证永远排不进榜
+    top_key = np.where(np.isnan(rank_chgs), -np.inf, rank_chgs)
+    top_idx = np.argpartition(-top_key, k - 1)[:k] if len(top_key) > k else np.arange(len(top_key))
+    top_idx = top_idx[np.argsort(-top_key[top_idx])]
+
     print("\n🔥 涨幅前5:")
-    for _, row in stock_df.head(5).iterrows():
-        print(f"   {row.get('名称', '')}: {row.get('涨幅%', 0):+.2f}%")
-    
+    for name, change in zip(rank_names[top_idx], rank_chgs[top_idx]):
+        print(f"   {name}: {change:+.2f}%")
+
+    bot_key = np.where(np.isnan(rank_chgs), np.inf, rank_chgs)
+    bot_idx = np.argpartition(bot_key, k - 1)[:k] if len(bot_key) > k else np.arange(len(bot_key))
+    bot_idx = bot_idx[np.argsort(bot_key[bot_idx])]
+
     print("\n❄️ 跌幅前5:")
-    for _, row in stock_df.tail(5).iloc[::-1].iterrows():
-        print(f"   {row.get('名称', '')}: {row.get('涨幅%', 0):+.2f}%")
+    for name, change in zip(rank_names[bot_idx], rank_chgs[bot_idx]):
+        print(f"   {name}: {change:+.2f}%")
     
     return stock_df, index_df
 
 
 def is_stock_list(file_path):
-    """判断是否为自选股列表格式"""
+    """判断是否为自选股列表格式（只查文件头部字节，不解码整行）"""
     try:
-        with open(file_path, 'r', encoding='gbk') as f:
-            first_line = f.readline()
-            return '代码' in first_line and '名称' in first_line
+        with open(file_path, 'rb') as f:
+            head = f.read(256)
+        for enc in ('gbk', 'utf-8'):
+            if '代码'.encode(enc) in head and '名称'.encode(enc) in head:
+                return True
+        return False
     except:
         return False
 
 
+def _load_file(file_path):
+    """
+    子进程解析入口：只做读取/解析；读取日志随结果带回主进程，
+    紧跟对应的文件头打印，保证输出顺序
+    """
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        if is_stock_list(file_path):
+            kind, payload = 'list', _cached_load(file_path, read_stock_list)
+        else:
+            kind, payload = 'kline', _cached_load(file_path, read_tdx_export)
+    return kind, payload, log.getvalue()
+
+
 # ============ 使用示例 ============
 
 if __name__ == "__main__":
@@ -399,20 +565,22 @@ if __name__ == "__main__":
         for i, f in enumerate(data_files, 1):
             print(f"  {i}. {f.name}")
         
-        # 分析所有文件
-        for file_path in data_files:
-            print(f"\n{'━' * 60}")
-            print(f"📁 文件: {file_path.name}")
-            print(f"{'━' * 60}")
-            
-            # 判断文件类型
-            if is_stock_list(file_path):
-                # 自选股列表格式
-                df = read_stock_list(file_path)
-                if df is not None:
-                    analyze_stock_list(df)
-            else:
-                # K线数据格式
-                df, stock_info = read_tdx_export(file_path)
-                if df is not None:
-                    analyze_kline(df, stock_info)
+        # 多进程并行解析（解析占大头且相互独立），按文件顺序回收结果分析
+        workers = min(len(data_files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for file_path, (kind, payload, log) in zip(data_files, ex.map(_load_file, data_files)):
+                print(f"\n{'━' * 60}")
+                print(f"📁 文件: {file_path.name}")
+                print(f"{'━' * 60}")
+                if log:
+                    sys.stdout.write(log)
+
+                if kind == 'list':
+                    # 自选股列表格式
+                    if payload is not None:
+                        analyze_stock_list(payload)
+                else:
+                    # K线数据格式
+                    df, stock_info = payload
+                    if df is not None:
+                        analyze_kline(df, stock_info)